@@ -0,0 +1,204 @@
+# mysql_binlog_monitor.py
+
+import asyncio
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from pymysqlreplication import BinLogStreamReader
+from pymysqlreplication.event import QueryEvent, XidEvent
+from pymysqlreplication.row_event import WriteRowsEvent
+from sqlalchemy.engine import make_url
+
+from components.mysql_table_monitor import close_engines, monitor_sql_table, notify_new_rows
+from components.site_uptime_monitor import MongoDBUrlManager
+from components.slack_notifier import SlackBatcher
+from utils.config import Settings, get_settings
+from utils.http import close_session
+from utils.log import setup_logging
+from utils.loop import install_eager_task_factory, install_event_loop_policy
+
+log = logging.getLogger(__name__)
+
+
+# Seconds between the server's heartbeats, so a dead connection is noticed while idle
+BINLOG_HEARTBEAT = 30
+BINLOG_RETRY_CAP = 60
+
+RowsCallback = Callable[[List[Dict[str, Any]], str, int], None]
+
+
+def _open_stream(settings: Settings, log_file: Optional[str] = None,
+                 log_pos: Optional[int] = None) -> BinLogStreamReader:
+    """
+    Open a blocking stream of inserts into ``MYSQL_TABLE_NAME``, from the given
+    position or from the current end of the binlog.
+    """
+    url = make_url(settings.MYSQL_HOST)
+    return BinLogStreamReader(
+        connection_settings={
+            'host': url.host,
+            'port': url.port or 3306,
+            'user': url.username,
+            'passwd': url.password or '',
+        },
+        server_id=settings.MYSQL_BINLOG_SERVER_ID,
+        only_events=[WriteRowsEvent, XidEvent, QueryEvent],
+        only_schemas=[url.database] if url.database else None,
+        only_tables=[settings.MYSQL_TABLE_NAME],
+        log_file=log_file,
+        log_pos=log_pos,
+        resume_stream=True,
+        blocking=True,
+        slave_heartbeat=BINLOG_HEARTBEAT,
+    )
+
+
+class BinlogTail:
+    """
+    Reads the blocking binlog stream in a daemon thread, so one replication connection
+    stays open instead of reconnecting on every read, and hands the rows inserted by each
+    transaction with the binlog position after its commit to ``on_rows`` on the event
+    loop. Positions are only taken at commits: resuming between a table map and its rows
+    events would drop those rows, so a failed stream replays the open transaction instead.
+    """
+
+    def __init__(self, settings: Settings, on_rows: RowsCallback,
+                 log_file: Optional[str] = None, log_pos: Optional[int] = None):
+        self.settings = settings
+        self.on_rows = on_rows
+        self.log_file = log_file
+        self.log_pos = log_pos
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream: Optional[BinLogStreamReader] = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="binlog-tail", daemon=True)
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._thread.start()
+
+    def close(self):
+        """Stop the thread. Closing the stream interrupts the blocking read it waits in."""
+        self._closed.set()
+        self._close_stream()
+
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception as e:
+                log.debug(f"Error closing the binlog stream: {str(e)}")
+
+    def _run(self):
+        failures = 0
+        while not self._closed.is_set():
+            try:
+                self._stream = _open_stream(self.settings, self.log_file, self.log_pos)
+                if self._closed.is_set():
+                    # close() ran while the stream was being opened
+                    break
+                rows = []
+                for event in self._stream:
+                    failures = 0
+                    if isinstance(event, WriteRowsEvent):
+                        rows.extend(row['values'] for row in event.rows)
+                        continue
+                    # A COMMIT query ends a non-transactional write, BEGIN starts any write
+                    if isinstance(event, QueryEvent) and event.query.upper() == 'BEGIN':
+                        continue
+                    self.log_file, self.log_pos = self._stream.log_file, self._stream.log_pos
+                    if rows:
+                        self._loop.call_soon_threadsafe(self.on_rows, rows, self.log_file, self.log_pos)
+                        rows = []
+            except Exception as e:
+                if self._closed.is_set():
+                    break
+                log.error(f"Error reading the binlog: {str(e)}")
+            finally:
+                self._close_stream()
+
+            self._closed.wait(min(BINLOG_RETRY_CAP, 2 ** failures))
+            failures += 1
+
+
+async def binlog_monitor(settings: Settings):
+    """
+    Tails the MySQL binary log for rows inserted into ``MYSQL_TABLE_NAME`` and posts
+    them to Slack, instead of polling the table with ``MYSQL_DETAILS_QUERY``. The binlog
+    position after the last reported commit is checkpointed in MongoDB, so a restart
+    resumes there and may report a transaction again, but never skips one.
+
+    Params
+    ------
+    settings: :class:`config.Settings`
+        Configuration settings for the monitoring process
+    """
+    log.info(f"Starting {settings.MYSQL_TABLE_NAME} binlog monitor")
+    url_manager = MongoDBUrlManager(settings)
+    inserts: asyncio.Queue = asyncio.Queue()
+    tail = None
+    try:
+        checkpoint = await url_manager.timestamp_collection.find_one({
+            'table_name': settings.MYSQL_TABLE_NAME
+        }) or {}
+        tail = BinlogTail(settings, lambda *insert: inserts.put_nowait(insert),
+                          checkpoint.get('log_file'), checkpoint.get('log_pos'))
+        tail.start()
+
+        while True:
+            new_rows, log_file, log_pos = await inserts.get()
+            while not inserts.empty():
+                rows, log_file, log_pos = inserts.get_nowait()
+                new_rows.extend(rows)
+
+            log.info(f"[{settings.MYSQL_TABLE_NAME}] Found {len(new_rows)} new rows")
+            await notify_new_rows(settings, new_rows)
+            await url_manager.timestamp_collection.update_one(
+                {'table_name': settings.MYSQL_TABLE_NAME},
+                {'$set': {'log_file': log_file, 'log_pos': log_pos}},
+                upsert=True
+            )
+    finally:
+        if tail is not None:
+            tail.close()
+        await url_manager.close()
+
+
+async def binlog_triggered_monitor(settings: Settings):
+    """
+    Run :func:`monitor_sql_table`, woken early by inserts seen in the binlog. Rows are
+    still read with ``MYSQL_DETAILS_QUERY``, so the stored watermark stays the source of
+    truth and polling every ``MONITOR_INTERVAL`` covers any missed binlog events.
+    """
+    wake = asyncio.Event()
+    tail = BinlogTail(settings, lambda *_: wake.set())
+    tail.start()
+    try:
+        await monitor_sql_table(settings, wake)
+    finally:
+        tail.close()
+
+
+async def main():
+    setup_logging()
+    install_eager_task_factory()
+    settings = get_settings()
+
+    table_monitor = binlog_triggered_monitor if settings.MYSQL_BINLOG_WAKEUP else binlog_monitor
+    try:
+        await table_monitor(settings)
+    except Exception as e:
+        log.exception(f"Monitoring failed {e}")
+    finally:
+        await close_engines()
+        await SlackBatcher.close()
+        await close_session()
+
+
+if __name__ == "__main__":
+    install_event_loop_policy()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        log.info("Monitoring stopped by user.")
@@ -1,103 +1,374 @@
 # mysql_table_monitor.py
 
 import asyncio
+import io
 import logging
-from datetime import datetime, timezone
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+import orjson
+from sqlalchemy import text, TextClause
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from components.site_uptime_monitor import MongoDBUrlManager
-from components.slack_notifier import SlackNotifier
-from utils.config import Settings
+from components.slack_notifier import SlackNotifier, SlackBatcher, MAX_BLOCK_TEXT
+from utils.config import Settings, get_settings
+from utils.http import close_session
+from utils.log import setup_logging
+from utils.loop import (install_eager_task_factory, install_event_loop_policy,
+                        install_stop_signal_handlers, wait_for_any)
 
 log = logging.getLogger(__name__)
 
+# Room for the "New rows added:" heading and the code fence around the row details
+ROW_DETAILS_LIMIT = MAX_BLOCK_TEXT - 32
+
+
+# What MYSQL_MAX_QUERY returns: an auto-increment id or a DATETIME column's maximum
+Watermark = Union[int, datetime]
+
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def _engine_for(dsn: str) -> AsyncEngine:
+    """Return the pooled engine for a DSN, creating it on first use."""
+    if dsn not in _engines:
+        # asyncmy parses the MySQL protocol in C, unlike aiomysql/pymysql, so use it
+        # whichever MySQL driver the DSN names
+        _engines[dsn] = create_async_engine(
+            make_url(dsn).set(drivername="mysql+asyncmy"),
+            echo=False,
+            pool_size=10,
+            max_overflow=10,
+            pool_timeout=30,
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            query_cache_size=1200
+        )
+    return _engines[dsn]
+
+
+async def close_engines():
+    engines = list(_engines.values())
+    _engines.clear()
+    await asyncio.gather(*(engine.dispose() for engine in engines))
+
 
 class DatabaseMonitor:
-    _engine = None
-    _async_session = None
-    last_check_time: Optional[datetime] = None
-
-    @classmethod
-    async def get_session(cls, settings: Settings) -> AsyncSession:
-        if not cls._engine:
-            cls._engine = create_async_engine(
-                settings.MYSQL_HOST,
-                echo=False,
-                pool_pre_ping=True,
-                pool_recycle=3600
-            )
-            cls._async_session = sessionmaker(
-                cls._engine, class_=AsyncSession, expire_on_commit=False
+    """The MySQL session factory and stored watermark of one monitored table."""
+
+    def __init__(self, settings: Settings, url_manager: MongoDBUrlManager):
+        self.settings = settings
+        self.url_manager = url_manager
+        self.engine = _engine_for(settings.MYSQL_HOST)
+        self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.last_check_time: Optional[datetime] = None
+        self.last_max: Optional[Watermark] = None
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """Yield a session on the pooled engine, closing it when the block exits."""
+        async with self.session_factory() as session:
+            yield session
+
+    async def get_last_check_time(self) -> datetime:
+        """Return the last check time, reading it from MongoDB only on the first call."""
+        if self.last_check_time is None:
+            last_check_doc = await self.url_manager.timestamp_collection.find_one({
+                'table_name': self.settings.MYSQL_TABLE_NAME
+            })
+            self.last_check_time = (
+                last_check_doc['last_check_time'] if last_check_doc
+                else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             )
-        return cls._async_session()
+        return self.last_check_time
+
+    async def server_time(self) -> datetime:
+        """Return MongoDB's clock, so the stored check times don't depend on this host's."""
+        return (await self.url_manager.db.command('hello'))['localTime']
+
+    async def update_last_check_time(self, last_check: datetime):
+        """Store ``last_check`` and keep it for the next check."""
+        await self.url_manager.timestamp_collection.update_one(
+            {'table_name': self.settings.MYSQL_TABLE_NAME},
+            {'$set': {'last_check_time': last_check}},
+            upsert=True
+        )
+        self.last_check_time = last_check
+
+    async def get_last_max(self) -> Optional[Watermark]:
+        """Return the stored ``MYSQL_MAX_QUERY`` watermark, or None if there is none yet."""
+        if self.last_max is None:
+            last_check_doc = await self.url_manager.timestamp_collection.find_one({
+                'table_name': self.settings.MYSQL_TABLE_NAME
+            })
+            self.last_max = last_check_doc.get('last_max') if last_check_doc else None
+        return self.last_max
+
+    async def update_last_max(self, last_max: Watermark):
+        await self.url_manager.timestamp_collection.update_one(
+            {'table_name': self.settings.MYSQL_TABLE_NAME},
+            {'$set': {'last_max': last_max}},
+            upsert=True
+        )
+        self.last_max = last_max
+
+
+@lru_cache(maxsize=None)
+def _column_labels(columns: str) -> Tuple[Tuple[str, str], ...]:
+    """Split the configured columns into ``(name, label)`` pairs, once per value."""
+    names = (column.strip() for column in columns.split(','))
+    return tuple((name, name.replace('_', ' ').title()) for name in names)
 
-    @classmethod
-    async def close(cls):
-        if cls._engine:
-            await cls._engine.dispose()
-            cls._engine = None
-            cls._async_session = None
 
+@lru_cache(maxsize=None)
+def _statement(sql: str) -> TextClause:
+    """Build the ``text()`` construct once per SQL string instead of on every poll."""
+    return text(sql)
 
-async def check_for_new_rows(settings: Settings, url_manager: MongoDBUrlManager) -> bool:
+
+def _quote_identifier(name: str) -> str:
+    """Backtick-quote a column name so reserved words such as ``key`` parse as identifiers."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+@lru_cache(maxsize=None)
+def _details_json_query(details_query: str, columns: str,
+                        watermark_column: Optional[str] = None) -> TextClause:
+    """
+    Wrap the details query so MySQL returns the configured columns of at most
+    ``:max_rows`` new rows as a single JSON array, instead of a result set decoded row
+    by row in Python.
+    """
+    names = [name for name, _ in _column_labels(columns)]
+    if watermark_column and watermark_column not in names:
+        names.append(watermark_column)
+    fields = ", ".join(f"'{name}', t.{_quote_identifier(name)}" for name in names)
+    return text(
+        f"SELECT JSON_ARRAYAGG(JSON_OBJECT({fields})) "
+        f"FROM (SELECT * FROM ({details_query.strip().rstrip(';')}) AS d LIMIT :max_rows) AS t"
+    )
+
+
+@lru_cache(maxsize=None)
+def _row_template(columns: str) -> str:
+    """Build the ``str.format_map`` template rendering one row, once per column list."""
+    return "\n".join(
+        f"• {label.replace('{', '{{').replace('}', '}}')}: {{{name}}}"
+        for name, label in _column_labels(columns)
+    )
+
+
+class _RowValues(dict):
+    def __missing__(self, key: str) -> str:
+        return 'N/A'
+
+
+def format_rows(rows: Sequence[Dict[str, Any]], columns: str,
+                limit: int = ROW_DETAILS_LIMIT) -> Iterator[str]:
+    """
+    Render one ``• Label: value`` line per column of every row. The rows are written
+    incrementally and yielded in chunks of at most ``limit`` characters, so that each
+    chunk fits in a single Slack section block.
+    """
+    template = _row_template(columns)
+    buffer = io.StringIO()
+    for row in rows:
+        lines = template.format_map(_RowValues(row))[:limit]
+        if buffer.tell() and buffer.tell() + len(lines) + 1 > limit:
+            yield buffer.getvalue()
+            buffer = io.StringIO()
+        if buffer.tell():
+            buffer.write("\n")
+        buffer.write(lines)
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def check_details_columns(monitor: DatabaseMonitor):
+    """
+    Make sure ``MYSQL_DETAILS_QUERY`` selects every column the JSON wrapper reads, so a
+    missing one stops the monitor at startup instead of failing every poll.
+
+    Raises
+    ------
+    ValueError
+        If the details query leaves out one of the columns.
+    """
+    settings = monitor.settings
+    probe = text(f"SELECT * FROM ({settings.MYSQL_DETAILS_QUERY.strip().rstrip(';')}) AS d LIMIT 0")
+    # NULL for every parameter: the query only has to compile, not match any row
+    params = dict.fromkeys(probe.compile().params)
     try:
-        # Retrieve or create last check time from MongoDB
-        last_check_doc = await url_manager.timestamp_collection.find_one({
-            'table_name': settings.MYSQL_TABLE_NAME
-        })
-
-        current_time = datetime.now(timezone.utc)
-        last_check = (last_check_doc['last_check_time'] if last_check_doc
-                      else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0))
-
-        last_check_formatted = last_check.strftime('%Y-%m-%d %H:%M:%S')
-
-        async with await DatabaseMonitor.get_session(settings) as session:
-            columns = settings.MYSQL_TABLE_COLUMNS
-
-            row_count_query = text(settings.MYSQL_SELECT_QUERY)
-            new_row_count = (await session.execute(row_count_query,
-                                                   {"last_check": last_check_formatted})).scalar_one()
-
-            if new_row_count > 0:
-                details_query = text(settings.MYSQL_DETAILS_QUERY)
-                new_rows = (await session.execute(details_query,
-                                                  {"last_check": last_check_formatted})).fetchall()
-
-                # Update last check time in MongoDB
-                await url_manager.timestamp_collection.update_one(
-                    {'table_name': settings.MYSQL_TABLE_NAME},
-                    {'$set': {'last_check_time': current_time}},
-                    upsert=True
-                )
-
-                row_details = "\n".join(
-                    f"• {column.replace('_', ' ').title()}: {getattr(r, column, 'N/A')}"
-                    for r in new_rows
-                    for column in columns.split(',')
-                )
-
-                log.info(f"[{settings.MYSQL_TABLE_NAME}] Found {new_row_count} new rows")
-                await SlackNotifier(
-                    link=settings.MYSQL_TABLE_NAME,
-                    is_table=True,
-                    settings=settings,
-                    stacktrace=f"New rows added:\n{row_details}",
-                    auto_close=True
-                )
-                return True
-
-            # Update last check time even if no new rows
-            await url_manager.timestamp_collection.update_one(
-                {'table_name': settings.MYSQL_TABLE_NAME},
-                {'$set': {'last_check_time': current_time}},
-                upsert=True
-            )
-            return False
+        async with monitor.session() as session:
+            selected = {key.lower() for key in (await session.execute(probe, params)).keys()}
+    except Exception as e:
+        log.warning(f"[{settings.MYSQL_TABLE_NAME}] Cannot check the details query columns: {e}")
+        return
+
+    names = [name for name, _ in _column_labels(settings.MYSQL_TABLE_COLUMNS)]
+    if settings.MYSQL_WATERMARK_COLUMN:
+        names.append(settings.MYSQL_WATERMARK_COLUMN)
+    # MySQL column names are case-insensitive
+    missing = [name for name in names if name.lower() not in selected]
+    if missing:
+        raise ValueError(
+            f"[{settings.MYSQL_TABLE_NAME}] MYSQL_DETAILS_QUERY does not select the "
+            f"column(s) {', '.join(missing)}"
+        )
+
+
+async def _fetch_details(session: AsyncSession, settings: Settings, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    details_query = _details_json_query(settings.MYSQL_DETAILS_QUERY,
+                                        settings.MYSQL_TABLE_COLUMNS,
+                                        settings.MYSQL_WATERMARK_COLUMN)
+    # One row past the cap tells a full batch apart from a truncated one
+    rows_json = (await session.execute(details_query,
+                                       {**params, "max_rows": settings.MYSQL_MAX_ROWS + 1})).scalar_one()
+    # JSON_ARRAYAGG returns NULL when there are no new rows
+    rows = orjson.loads(rows_json) if rows_json else []
+    if len(rows) > settings.MYSQL_MAX_ROWS:
+        # Without MYSQL_WATERMARK_COLUMN the watermark still advances past the rows cut off
+        log.warning(f"[{settings.MYSQL_TABLE_NAME}] New rows truncated to {settings.MYSQL_MAX_ROWS}")
+        del rows[settings.MYSQL_MAX_ROWS:]
+    return rows
+
+
+def _max_observed(rows: Sequence[Dict[str, Any]], settings: Settings) -> Any:
+    """Return the highest ``MYSQL_WATERMARK_COLUMN`` value among the rows, if any."""
+    values = [row[settings.MYSQL_WATERMARK_COLUMN] for row in rows
+              if row.get(settings.MYSQL_WATERMARK_COLUMN) is not None]
+    return max(values, default=None)
+
+
+def _as_datetime(value: Any, settings: Settings) -> datetime:
+    """
+    Convert a ``MYSQL_WATERMARK_COLUMN`` value to the next last check time, refusing
+    anything but a date and time so no unusable watermark is ever stored.
+    """
+    # JSON_OBJECT renders DATETIME columns as 'YYYY-MM-DD hh:mm:ss.ffffff' strings
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    elif isinstance(value, datetime):
+        return value
+    raise ValueError(
+        f"MYSQL_WATERMARK_COLUMN {settings.MYSQL_WATERMARK_COLUMN} must hold dates and times "
+        f"unless MYSQL_MAX_QUERY is set, got {value!r}"
+    )
+
+
+async def _gather_all(*aws: Awaitable) -> List[Any]:
+    """
+    Like :func:`asyncio.gather`, but only raises once every awaitable is done. A failed
+    MongoDB call must not leave the session's connection checkout or close in flight,
+    or the session cannot be closed and the connection never returns to the pool.
+    """
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+async def _fetch_rows_since_last_check(monitor: DatabaseMonitor) -> List[Dict[str, Any]]:
+    settings = monitor.settings
+    async with monitor.session() as session:
+        last_check, started, _ = await _gather_all(
+            monitor.get_last_check_time(),
+            monitor.server_time(),
+            session.connection()
+        )
+
+        last_check_formatted = last_check.strftime('%Y-%m-%d %H:%M:%S.%f')
+        new_rows = await _fetch_details(session, settings, {"last_check": last_check_formatted})
+
+        if not settings.MYSQL_WATERMARK_COLUMN:
+            # Taken before the query, so rows committed while it runs are picked up next time
+            update = monitor.update_last_check_time(started)
+        elif (newest := _max_observed(new_rows, settings)) is not None:
+            update = monitor.update_last_check_time(_as_datetime(newest, settings))
+        else:
+            return new_rows
+
+        await _gather_all(session.close(), update)
+    return new_rows
+
+
+async def _fetch_rows_since_last_max(monitor: DatabaseMonitor) -> List[Dict[str, Any]]:
+    """
+    Probe ``MYSQL_MAX_QUERY`` (e.g. ``SELECT MAX(id) FROM t``), a single index seek, and
+    only run the details query with ``:last_max`` and ``:current_max`` when the value
+    moved past the watermark.
+    """
+    settings = monitor.settings
+    async with monitor.session() as session:
+        last_max, _ = await _gather_all(
+            monitor.get_last_max(),
+            session.connection()
+        )
+
+        current_max = (await session.execute(_statement(settings.MYSQL_MAX_QUERY))).scalar_one()
+        if current_max is None or (last_max is not None and current_max <= last_max):
+            return []
+
+        # Without a watermark yet, start from the current maximum instead of replaying the table
+        # :current_max lets the details query leave out rows committed after the probe,
+        # which the stored watermark would not cover
+        new_rows = (await _fetch_details(session, settings,
+                                         {"last_max": last_max, "current_max": current_max})
+                    if last_max is not None else [])
+
+        if settings.MYSQL_WATERMARK_COLUMN and new_rows:
+            # Rows committed after the probe may already be in the details result
+            newest = _max_observed(new_rows, settings)
+            if newest is not None and isinstance(current_max, datetime):
+                newest = _as_datetime(newest, settings)
+            if newest is not None and newest > current_max:
+                current_max = newest
+
+        await _gather_all(
+            session.close(),
+            monitor.update_last_max(current_max)
+        )
+    return new_rows
+
+
+async def notify_new_rows(settings: Settings, rows: Sequence[Dict[str, Any]]):
+    """
+    Post the rows to Slack, split into blocks that fit Slack's limit. Only the first
+    notification mentions the users; the rest continue it.
+    """
+    for index, row_details in enumerate(format_rows(rows, settings.MYSQL_TABLE_COLUMNS)):
+        await SlackNotifier(
+            link=settings.MYSQL_TABLE_NAME,
+            is_table=True,
+            settings=settings,
+            stacktrace=f"New rows added:\n{row_details}" if index == 0 else row_details,
+            is_continuation=index > 0
+        )
+
+
+async def check_for_new_rows(monitor: DatabaseMonitor) -> bool:
+    settings = monitor.settings
+    try:
+        if settings.MYSQL_MAX_QUERY:
+            new_rows = await _fetch_rows_since_last_max(monitor)
+        else:
+            new_rows = await _fetch_rows_since_last_check(monitor)
+        new_row_count = len(new_rows)
+
+        if new_row_count > 0:
+            log.info(f"[{settings.MYSQL_TABLE_NAME}] Found {new_row_count} new rows")
+            await notify_new_rows(settings, new_rows)
+            return True
+
+        return False
 
     except Exception as e:
         error_message = f"Error checking for new rows: {str(e)}"
@@ -106,37 +377,97 @@ async def check_for_new_rows(settings: Settings, url_manager: MongoDBUrlManager)
             link=settings.MYSQL_TABLE_NAME,
             is_table=True,
             settings=settings,
-            stacktrace=error_message,
-            auto_close=True
+            stacktrace=error_message
         )
         return False
 
 
-async def monitor_sql_table(settings: Settings):
+async def monitor_sql_table(settings: Settings, wake: Optional[asyncio.Event] = None,
+                            stop: Optional[asyncio.Event] = None,
+                            url_manager: Optional[MongoDBUrlManager] = None):
+    """
+    Check for new rows every ``MONITOR_INTERVAL`` seconds, or as soon as ``wake`` is set
+    when one is given, with the interval kept as a safety net. Returns once ``stop`` is
+    set, without waiting for the rest of the interval. Pass ``url_manager`` to share a
+    MongoDB client between monitors; otherwise one is created and closed here.
+    """
     log.info(f"Starting {settings.MYSQL_TABLE_NAME} monitor")
-    url_manager = MongoDBUrlManager(settings)
-    while True:
-        try:
-            await check_for_new_rows(settings, url_manager)
-        except Exception as e:
-            log.error(f"Error in monitor loop: {str(e)}")
+    owns_url_manager = url_manager is None
+    monitor = DatabaseMonitor(settings, url_manager or MongoDBUrlManager(settings))
+    events = [event for event in (wake, stop) if event is not None]
+    try:
+        await check_details_columns(monitor)
+        while stop is None or not stop.is_set():
+            try:
+                await check_for_new_rows(monitor)
+            except Exception as e:
+                log.error(f"Error in monitor loop: {str(e)}")
+
+            if not events:
+                await asyncio.sleep(settings.MONITOR_INTERVAL)
+                continue
+            await wait_for_any(settings.MONITOR_INTERVAL, *events)
+            if wake is not None:
+                wake.clear()
+    finally:
+        if owns_url_manager:
+            await monitor.url_manager.close()
+    log.info(f"Stopped {settings.MYSQL_TABLE_NAME} monitor")
+
 
-        await asyncio.sleep(settings.MONITOR_INTERVAL)
+def table_settings(settings: Settings) -> List[Settings]:
+    """
+    Return the settings of every monitored table: ``MYSQL_TABLE_NAME`` and ``MYSQL_TABLES``.
+    The extra tables share everything but the primary table's queries and watermark
+    column, and inherit ``MYSQL_MAX_ROWS`` unless they set it.
+    """
+    table_defaults = {
+        'MYSQL_SELECT_QUERY': None,
+        'MYSQL_MAX_QUERY': None,
+        'MYSQL_WATERMARK_COLUMN': None,
+        'MYSQL_TABLES': [],
+    }
+    return [settings] + [
+        settings.model_copy(update={**table_defaults, **table.model_dump(exclude_none=True)})
+        for table in settings.MYSQL_TABLES
+    ]
+
+
+async def monitor_sql_tables(settings: Settings, stop: Optional[asyncio.Event] = None):
+    """
+    Run :func:`monitor_sql_table` for every configured table. Tables on the same
+    ``MYSQL_HOST`` share one engine, so they draw from one connection pool, and all of
+    them share one MongoDB client.
+    """
+    url_manager = MongoDBUrlManager(settings)
+    try:
+        # A failing monitor cancels the others, before the client they share is closed
+        async with asyncio.TaskGroup() as group:
+            for table in table_settings(settings):
+                group.create_task(monitor_sql_table(table, stop=stop, url_manager=url_manager))
+    finally:
+        await url_manager.close()
 
 
 async def main():
-    logging.basicConfig(level=logging.INFO)
-    settings = Settings()
+    setup_logging()
+    install_eager_task_factory()
+    settings = get_settings()
+    stop = asyncio.Event()
+    install_stop_signal_handlers(stop)
 
     try:
-        await monitor_sql_table(settings)
+        await monitor_sql_tables(settings, stop=stop)
     except Exception as e:
         log.exception(f"Monitoring failed {e}")
     finally:
-        await DatabaseMonitor.close()
+        await close_engines()
+        await SlackBatcher.close()
+        await close_session()
 
 
 if __name__ == "__main__":
+    install_event_loop_policy()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
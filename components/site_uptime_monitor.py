@@ -1,46 +1,137 @@
 # components/site_uptime_monitor.py
 
 import asyncio
+import heapq
 import logging
 import traceback
-from typing import Dict, Tuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
 
-import motor.motor_asyncio
 from aiohttp import ClientSession, ClientTimeout, ClientError
-from pydantic import HttpUrl
-
-from components.slack_notifier import SlackNotifier
-from utils.config import Settings
+from pydantic import HttpUrl, ValidationError
+from pymongo import AsyncMongoClient
+from pymongo.errors import PyMongoError
+
+from components.slack_notifier import SlackNotifier, SlackBatcher
+from utils.config import Settings, get_settings
+from utils.http import get_session, close_session
+from utils.log import setup_logging
+from utils.loop import install_eager_task_factory, install_event_loop_policy
 from utils.scraper import extract_stacktrace
 
-logging.basicConfig(
-    filename="uptime.log",
-    encoding="utf-8",
-    level=logging.INFO,
-    format="[%(levelname)s] [%(asctime)s] %(message)s",
-)
 log = logging.getLogger(__name__)
 
+PROBE_HEADERS = {'User-Agent': 'uptime-robot', 'Accept': '*/*'}
+# Sent when HEAD is rejected: only the first byte, and no compressed body to decode
+RANGE_HEADERS = {**PROBE_HEADERS, 'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'}
+# HEAD responses that say nothing about whether the site itself is up
+HEAD_UNSUPPORTED = frozenset({403, 405, 501})
+
+# The longest wait, in seconds, before reopening a failed change stream
+WATCH_RETRY_CAP = 300
+
+# Only the changes that can alter the URL list, not e.g. name or updated_at refreshes
+URL_CHANGES_PIPELINE = [{'$match': {'$or': [
+    {'operationType': {'$in': ['insert', 'replace', 'delete', 'drop', 'rename', 'invalidate']}},
+    {'updateDescription.updatedFields.url': {'$exists': True}},
+]}}]
+
 
 class MongoDBUrlManager:
     def __init__(self, settings: Settings):
-        self.client = motor.motor_asyncio.AsyncIOMotorClient(settings.MONGODB_URI)
+        self.client = AsyncMongoClient(settings.MONGODB_URI, maxPoolSize=50)
         self.db = self.client[settings.MONGODB_DB]
         self.url_collection = self.db['monitored_urls']
         self.timestamp_collection = self.db['monitored_tables']
         self.site_status_collection = self.db['site_status']
-
-    async def get_urls(self):
-        urls = await self.url_collection.find().to_list(length=None)
-        return [self._validate_url(url['url']) for url in urls]
-
-    async def get_site_status(self, url: str) -> bool:
+        self._status_cache: Dict[str, bool] = {}
+        self._urls_cache: Optional[List[str]] = None
+        # Bumped on every change to the URL list, to spot changes made during a load
+        self._urls_generation = 0
+        self._watch_task: Optional[asyncio.Task] = None
+        self._watch_started: Optional[asyncio.Event] = None
+        # Whether the change stream is open, i.e. whether the cached list can be trusted
+        self._watching = False
+
+    async def get_urls(self) -> List[str]:
+        """
+        Get the monitored URLs. The list is cached and invalidated by a change stream
+        on the collection; while the stream is down (e.g. no replica set) it is reloaded
+        every call.
+        """
+        if self._watch_task is None:
+            # Open the stream before the first load, so no change can fall in between
+            self._watch_started = asyncio.Event()
+            self._watch_task = asyncio.create_task(self._watch_urls())
+            await self._watch_started.wait()
+
+        if self._urls_cache is None or not self._watching:
+            generation = self._urls_generation
+            urls = await self.url_collection.find({}, projection={'url': 1, '_id': 0}).to_list(length=None)
+            urls = map(self._validate_url, (doc['url'] for doc in urls))
+            urls = list(dict.fromkeys(url for url in urls if url))
+            # A change that arrived during the load may be missing from it, so don't keep it
+            if self._watching and generation == self._urls_generation:
+                self._urls_cache = urls
+            return urls
+        return self._urls_cache
+
+    async def close(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            await asyncio.gather(self._watch_task, return_exceptions=True)
+            self._watch_task = None
+        await self.client.close()
+
+    async def _watch_urls(self):
+        """
+        Drop the cached URL list on every change to it. A failed or invalidated stream is
+        reopened after a growing delay, resuming after the last change seen when it can.
+        """
+        resume_token = None
+        failures = 0
+        while True:
+            try:
+                async with await self.url_collection.watch(URL_CHANGES_PIPELINE,
+                                                          resume_after=resume_token) as stream:
+                    self._watching = True
+                    self._watch_started.set()
+                    failures = 0
+                    async for change in stream:
+                        self._urls_generation += 1
+                        self._urls_cache = None
+                        # An invalidated stream cannot be resumed, the next one starts afresh
+                        resume_token = (None if change['operationType'] == 'invalidate'
+                                        else stream.resume_token)
+            except PyMongoError as e:
+                if not self._watching:
+                    # The token may be too old to resume from, so don't try it again
+                    resume_token = None
+                log.warning(f"Cannot watch the monitored URLs, reloading them every cycle: {e}")
+            finally:
+                self._watching = False
+                self._watch_started.set()
+
+            # Changes may be missed until the stream is open again
+            self._urls_generation += 1
+            self._urls_cache = None
+            await asyncio.sleep(min(WATCH_RETRY_CAP, 2 ** failures))
+            failures += 1
+
+    async def load_site_statuses(self):
+        """Seed the in-memory status cache from MongoDB"""
+        statuses = await self.site_status_collection.find(
+            {}, projection={'url': 1, 'is_up': 1, '_id': 0}
+        ).to_list(length=None)
+        self._status_cache = {status['url']: status['is_up'] for status in statuses}
+
+    def get_site_status(self, url: str) -> bool:
         """Get the current status of a site (True if up, False if down)"""
-        status = await self.site_status_collection.find_one({'url': url})
-        return status['is_up'] if status else True
+        return self._status_cache.get(url, True)
 
     async def update_site_status(self, url: str, is_up: bool):
         """Update the status of a site"""
+        self._status_cache[url] = is_up
         await self.site_status_collection.update_one(
             {'url': url},
             {'$set': {'url': url, 'is_up': is_up}},
@@ -48,14 +139,24 @@ class MongoDBUrlManager:
         )
 
     @staticmethod
-    def _validate_url(url: str) -> HttpUrl:
+    @lru_cache(maxsize=None)
+    def _validate_url(url: str) -> Optional[str]:
+        """
+        Return the URL normalised by ``HttpUrl`` (lowercase host, trailing slash), the
+        form the site statuses are keyed by, or None if it is invalid. Memoised, so the
+        reloads of the URL list don't validate the same documents again.
+        """
         if not url.startswith(('http://', 'https://')):
             url = f'http://{url}'
-        return HttpUrl(url)
+        try:
+            return str(HttpUrl(url))
+        except ValidationError:
+            log.error(f"Skipping invalid URL '{url}'")
+            return None
 
 
 async def send_request(
-        url: HttpUrl,
+        url: str,
         session: ClientSession,
         settings: Settings,
         url_manager: MongoDBUrlManager,
@@ -65,43 +166,58 @@ async def send_request(
     Send requests to the given URL and notify only when status changes.
     Attempts to extract stacktrace information from error pages.
     """
-    url_str = str(url)
-    was_up = await url_manager.get_site_status(url_str)
+    was_up = url_manager.get_site_status(url)
     is_up = False
+    timeout = ClientTimeout(total=settings.REQUEST_TIMEOUT)
 
     try:
         # First try HEAD request
-        async with session.head(str(url), allow_redirects=True) as response:
-            if response.status == 200:
-                is_up = True
-                if not was_up:
-                    log.info(f"Site '{response.url}' has been restored")
-                    await SlackNotifier(
-                        HttpUrl(str(response.url)),
-                        is_table=False,
-                        settings=settings,
-                        is_restored=True
-                    )
-                    await url_manager.update_site_status(url_str, True)
-                return retries, True
-
-            # If HEAD fails, try GET to check for stacktrace
-            async with session.get(str(url), allow_redirects=True) as response:
-                response_text = await response.text()
-                stacktrace = await extract_stacktrace(response_text)
-
-                log.info(f"Site '{response.url}' with response status '{response.status}'")
-                if was_up:
-                    await SlackNotifier(
-                        HttpUrl(str(response.url)),
-                        is_table=False,
-                        settings=settings,
-                        is_restored=False,
-                        stacktrace=stacktrace if stacktrace else ""
-                    )
-                    await url_manager.update_site_status(url_str, False)
-
-    except ClientError as e:
+        async with session.head(url, headers=PROBE_HEADERS, allow_redirects=True,
+                                timeout=timeout) as response:
+            status, response_url = response.status, response.url
+
+        if status in HEAD_UNSUPPORTED:
+            # Many servers, CDNs and WAFs reject HEAD, so ask for the first byte of the page
+            # instead; the body is never read, the connection is released on exit
+            async with session.get(url, headers=RANGE_HEADERS, allow_redirects=True,
+                                   timeout=timeout) as response:
+                status, response_url = response.status, response.url
+            if status == 416:
+                # An empty page has no first byte, but the server did answer
+                status = 200
+
+        if 200 <= status < 400:
+            is_up = True
+            if not was_up:
+                log.info(f"Site '{response_url}' has been restored")
+                await SlackNotifier(
+                    str(response_url),
+                    is_table=False,
+                    settings=settings,
+                    is_restored=True
+                )
+                await url_manager.update_site_status(url, True)
+            # Only consecutive failures count towards REQUEST_RETRIES
+            return 0, True
+
+        # If HEAD fails, try GET to check for stacktrace
+        async with session.get(url, allow_redirects=True, timeout=timeout) as response:
+            response_text = await response.text()
+            stacktrace = await extract_stacktrace(response_text)
+
+            log.info(f"Site '{response.url}' with response status '{response.status}'")
+            if was_up:
+                await SlackNotifier(
+                    str(response.url),
+                    is_table=False,
+                    settings=settings,
+                    is_restored=False,
+                    stacktrace=stacktrace if stacktrace else ""
+                )
+                await url_manager.update_site_status(url, False)
+
+    except (ClientError, asyncio.TimeoutError) as e:
+        # aiohttp raises a plain TimeoutError, not a ClientError, when a site hangs
         log.error(f"Failed to monitor site '{url}': {e}")
         if was_up:
             error_stacktrace = f"{str(e)}\n{traceback.format_exc()}"
@@ -112,87 +228,171 @@ async def send_request(
                 stacktrace=error_stacktrace,
                 is_restored=False
             )
-            await url_manager.update_site_status(url_str, False)
+            await url_manager.update_site_status(url, False)
         retries += 1
 
     return retries, is_up
 
 
-async def monitor_links(url: HttpUrl, settings: Settings, url_manager: MongoDBUrlManager):
+async def guarded_check(
+        url: str,
+        session: ClientSession,
+        settings: Settings,
+        url_manager: MongoDBUrlManager,
+        retries: Dict[str, int],
+        semaphore: asyncio.Semaphore,
+) -> bool:
     """
-    Monitors the specified URL by sending periodic HTTP requests.
-    Uses different intervals based on site status.
+    Checks the specified URL while holding a slot of the shared semaphore, so that
+    at most ``MAX_CONCURRENT_REQUESTS`` requests are in flight at any time.
 
     Params
     ------
-    url: :class:`pydantic.HttpUrl`
-        The URL to be monitored
+    url: str
+        The URL to be checked
+    session: :class:`aiohttp.ClientSession`
+        The session shared by all checks
     settings: :class:`config.Settings`
         Configuration settings for the monitoring process
     url_manager: :class:`MongoDBUrlManager`
         The URL manager instance for tracking site status
+    retries: Dict[str, int]
+        Failed request count per URL, updated in place
+    semaphore: :class:`asyncio.Semaphore`
+        Bounds the number of concurrent requests
+
+    Returns
+    -------
+    bool
+        Whether the site is up
     """
-    retries = 0
-    max_retries = settings.REQUEST_RETRIES
-    timeout = ClientTimeout(total=settings.REQUEST_TIMEOUT)
-
-    async with ClientSession(timeout=timeout) as session:
-        while retries < max_retries:
-            retries, is_up = await send_request(url, session, settings, url_manager, retries)
-
-            # Use shorter interval if site is down
-            interval = (
-                settings.MONITOR_INTERVAL if is_up
-                else settings.DOWN_MONITOR_INTERVAL
-            )
-
-            if not is_up:
-                log.info(
-                    f"Site {url} is down, checking again in "
-                    f"{settings.DOWN_MONITOR_INTERVAL} seconds"
-                )
+    async with semaphore:
+        retries[url], is_up = await send_request(
+            url, session, settings, url_manager, retries.get(url, 0)
+        )
 
-            await asyncio.sleep(interval)
+    if not is_up:
+        log.info(
+            f"Site {url} is down, checking again in "
+            f"{settings.DOWN_MONITOR_INTERVAL} seconds"
+        )
+    return is_up
 
 
-async def spawn_site_monitors(
-        url_manager: MongoDBUrlManager,
-        store: Dict[str, asyncio.Task],
-        settings: Settings,
-):
-    urls = await url_manager.get_urls()
-    current_links = set(store.keys())
-
-    for url in urls:
-        url_str = str(url)
-        if url_str not in store:
-            task = asyncio.create_task(
-                monitor_links(url, settings, url_manager),
-                name=url_str
-            )
-            store[url_str] = task
-            current_links.discard(url_str)
+class PollScheduler:
+    """
+    Schedules the site checks from a single ``heapq`` of ``(due, url)`` entries, so the
+    monitor waits on one timer instead of one ``asyncio.sleep`` per site.
+    """
 
-    for link in current_links:
-        task = store.pop(link)
-        task.cancel()
+    def __init__(self):
+        self._heap: List[Tuple[float, str]] = []
+        self._wakeup = asyncio.Event()
+
+    def add(self, url: str, due: float):
+        heapq.heappush(self._heap, (due, url))
+        self._wakeup.set()
+
+    async def pop_due(self, deadline: float) -> List[str]:
+        """
+        Wait until at least one URL is due, or until ``deadline`` (event loop time)
+        passes, and pop every URL that is due.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+            if due or now >= deadline:
+                return due
+
+            self._wakeup.clear()
+            wake_at = min(self._heap[0][0], deadline) if self._heap else deadline
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wake_at - now)
+            except asyncio.TimeoutError:
+                pass
 
 
 async def monitor_urls():
-    settings = Settings()
+    """
+    Monitors all URLs from a single :class:`PollScheduler`. Each check reschedules its
+    URL after ``MONITOR_INTERVAL``, or ``DOWN_MONITOR_INTERVAL`` while the site is down,
+    and the URL list is reloaded every ``MONITOR_INTERVAL``.
+    """
+    settings = get_settings()
     url_manager = MongoDBUrlManager(settings)
-    store: Dict[str, asyncio.Task] = {}
-
-    await spawn_site_monitors(url_manager, store, settings)
+    semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+    scheduler = PollScheduler()
+    urls: Set[str] = set()
+    retries: Dict[str, int] = {}
+    scheduled: Set[str] = set()
+    checks: Set[asyncio.Task] = set()
+    loop = asyncio.get_running_loop()
+    session = await get_session()
+    await url_manager.load_site_statuses()
+
+    async def check(link: str):
+        is_up = False
+        try:
+            is_up = await guarded_check(link, session, settings, url_manager, retries, semaphore)
+        except Exception as e:
+            log.error(f"Failed to check site '{link}': {e}")
+
+        if link in urls and retries.get(link, 0) < settings.REQUEST_RETRIES:
+            interval = settings.MONITOR_INTERVAL if is_up else settings.DOWN_MONITOR_INTERVAL
+            scheduler.add(link, loop.time() + interval)
+        else:
+            if link in urls:
+                log.warning(
+                    f"Site '{link}' failed {retries[link]} checks in a row, no longer monitoring it"
+                )
+            scheduled.discard(link)
 
-    while True:
-        await asyncio.sleep(settings.MONITOR_INTERVAL)
-        await spawn_site_monitors(url_manager, store, settings)
+    next_refresh = loop.time()
+    try:
+        while True:
+            if loop.time() >= next_refresh:
+                urls = set(await url_manager.get_urls())
+
+                for link in retries.keys() - urls:
+                    retries.pop(link)
+
+                now = loop.time()
+                for link in urls - scheduled:
+                    if retries.get(link, 0) < settings.REQUEST_RETRIES:
+                        scheduled.add(link)
+                        scheduler.add(link, now)
+                next_refresh = now + settings.MONITOR_INTERVAL
+
+            for link in await scheduler.pop_due(next_refresh):
+                if link not in urls:
+                    scheduled.discard(link)
+                    continue
+                task = asyncio.create_task(check(link), name=link)
+                checks.add(task)
+                task.add_done_callback(checks.discard)
+    finally:
+        for task in checks:
+            task.cancel()
+        await asyncio.gather(*checks, url_manager.close(), return_exceptions=True)
+
+
+async def main():
+    setup_logging()
+    install_eager_task_factory()
+    try:
+        await monitor_urls()
+    finally:
+        await SlackBatcher.close()
+        await close_session()
 
 
 if __name__ == "__main__":
+    install_event_loop_policy()
     try:
-        asyncio.run(monitor_urls())
+        asyncio.run(main())
     except KeyboardInterrupt:
         log.info("Monitoring stopped by user.")
     except Exception as e:
@@ -1,67 +1,77 @@
 import asyncio
 import logging
-from typing import Optional, Generator, List
+import random
+from typing import Optional, Generator, List, Sequence
 
 import aiohttp
+import orjson
 
 from utils.config import Settings
+from utils.http import get_session
 
 log = logging.getLogger(__name__)
 
+SLACK_TIMEOUT = aiohttp.ClientTimeout(total=10)
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Slack rejects section blocks whose text is longer than this
+MAX_BLOCK_TEXT = 3000
 
-class SlackNotifier:
-    """
-    A class used to handle sending notifications to Slack using webhooks. This class provides
-    methods to manage the HTTP session and send messages.
 
-    Attributes
-    ----------
-    _session: Optional[aiohttp.ClientSession]
-        A private class attribute to store the HTTP session instance.
+def _backoff(attempt: int, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5) -> float:
     """
+    Exponential backoff capped at ``cap`` seconds. The random jitter keeps simultaneous
+    alerts from retrying in lock-step.
+    """
+    return min(cap, base * 2 ** attempt) * (1 + random.random() * jitter)
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1] + "…"
 
-    _session: Optional[aiohttp.ClientSession] = None
 
-    DEFAULT_USERS = ["U054ETQ0E", "USERA6XFF"]
+def _section(text: str) -> dict:
+    return {"type": "section", "text": {"type": "mrkdwn", "text": _clip(text, MAX_BLOCK_TEXT)}}
 
-    def __init__(self, link: str, is_table: bool, settings: Settings, *, auto_close: bool = False,
-                 stacktrace: str = "", users_to_notify: List[str] = None, is_restored: bool = False):
-        self.link = link
+
+def _code_section(text: str) -> dict:
+    """A section showing ``text`` in a code block, clipped so the fence stays intact."""
+    return _section(f"```{_clip(text, MAX_BLOCK_TEXT - 6)}```")
+
+
+class SlackNotifier:
+    """
+    A class used to handle sending notifications to Slack using webhooks. Messages are
+    posted over the process-wide HTTP session from :mod:`utils.http`.
+    """
+
+    DEFAULT_USERS = ("U054ETQ0E", "USERA6XFF")
+    _DEFAULT_MENTIONS = " ".join(f"<@{user_id}>" for user_id in DEFAULT_USERS) + " "
+
+    def __init__(self, link: str, is_table: bool, settings: Settings, *,
+                 stacktrace: str = "", users_to_notify: Sequence[str] = None, is_restored: bool = False,
+                 is_continuation: bool = False):
+        self.link = str(link)
         self.is_table: bool = is_table
         self.settings = settings
-        self.auto_close = auto_close
         self.stacktrace = stacktrace
         self.users_to_notify = users_to_notify if users_to_notify is not None else self.DEFAULT_USERS
         self.is_restored = is_restored
+        self.is_continuation = is_continuation
 
     def __await__(self) -> Generator:
-        """Make the class awaitable."""
-
-        async def _notify():
-            await self.send_notification()
-
-        return _notify().__await__()
-
-    @classmethod
-    async def get_session(cls) -> aiohttp.ClientSession:
-        if cls._session is None or cls._session.closed:
-            cls._session = aiohttp.ClientSession()
-        return cls._session
-
-    @classmethod
-    async def close_session(cls):
-        if cls._session is not None and not cls._session.closed:
-            await cls._session.close()
-            cls._session = None
+        """Make the class awaitable. The notification is queued on the :class:`SlackBatcher`."""
+        return SlackBatcher.enqueue(self).__await__()
 
     def _format_user_mentions(self) -> str:
         """Format user IDs into Slack mentions."""
+        if self.users_to_notify is self.DEFAULT_USERS:
+            return self._DEFAULT_MENTIONS
         if not self.users_to_notify:
             return ""
         mentions = " ".join(f"<@{user_id}>" for user_id in self.users_to_notify)
         return f"{mentions} "
 
-    async def send_slack_message(self, payload: dict):
+    async def send_slack_message(self, payload: dict) -> Optional[int]:
         """
         Sends a message to Slack using the provided webhook URL.
 
@@ -70,61 +80,68 @@ class SlackNotifier:
         payload: dict
             The message payload to be sent to Slack.
 
-        Raises
-        ------
-        aiohttp.ClientError
-            If sending the message fails after the specified number of retries.
+        Returns
+        -------
+        Optional[int]
+            The status of the last response, or None if Slack never answered.
         """
-        session = await self.get_session()
-        if session.closed:
-            session = await self.get_session()
-        retries = getattr(self.settings, 'REQUEST_RETRIES', 3)
+        session = await get_session()
+        webhook_url = self.settings.SLACK_WEBHOOK_URL
+        retries = self.settings.REQUEST_RETRIES
+        body = orjson.dumps(payload)
 
+        status = None
         for retry in range(retries):
+            delay = _backoff(retry)
             try:
-                async with session.post(self.settings.SLACK_WEBHOOK_URL, json=payload) as response:
-                    if response.status == 200:
-                        break
-                    else:
-                        log.error(f"Failed to send Slack message. Status: {response.status}")
-
-                await asyncio.sleep(2 ** retry)
-            except aiohttp.ClientError as e:
-                log.error(f"Failed to send Slack message: {e}")
-                await asyncio.sleep(2 ** retry)
-        else:
-            log.error(f"Failed to send Slack message after {retries} retries")
+                async with session.post(webhook_url, data=body, headers=JSON_HEADERS,
+                                        timeout=SLACK_TIMEOUT) as response:
+                    status = response.status
+                    if status == 200:
+                        return status
+
+                    reason = (await response.text())[:200]
+                    log.error(f"Failed to send Slack message. Status: {status}, response: {reason}")
+                    if response.status == 429:
+                        try:
+                            delay = float(response.headers.get('Retry-After', delay))
+                        except ValueError:
+                            pass
+                    elif 400 <= response.status < 500:
+                        # A bad webhook URL or payload will not succeed on a retry
+                        return status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log.error(f"Failed to send Slack message: {e!r}")
+
+            if retry < retries - 1:
+                await asyncio.sleep(delay)
+
+        log.error(f"Failed to send Slack message after {retries} retries")
+        return status
+
+    def build_table_update_payload(self) -> dict:
+        table_name = self.settings.MYSQL_TABLE_NAME
+        if self.is_continuation:
+            return {
+                "blocks": [_code_section(self.stacktrace)],
+                "text": f"{table_name} Update Alert (continued)"
+            }
 
-    async def send_table_update_notification(self):
         user_mentions = self._format_user_mentions()
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"{user_mentions}*{self.settings.MYSQL_TABLE_NAME} "
-                            f"Update Alert*\n{self.link} has new entries!"
-                }
-            }
-        ]
+        blocks = [_section(f"{user_mentions}*{table_name} "
+                           f"Update Alert*\n{self.link} has new entries!")]
 
         if self.stacktrace:
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"```{self.stacktrace}```"
-                }
-            })
+            blocks.append(_code_section(self.stacktrace))
 
         payload = {
             "blocks": blocks,
-            "text": f"{user_mentions}{self.settings.MYSQL_TABLE_NAME} Update Alert"
+            "text": f"{user_mentions}{table_name} Update Alert"
         }
 
-        await self.send_slack_message(payload)
+        return payload
 
-    async def send_site_down_notification(self):
+    def build_site_down_payload(self) -> dict:
         user_mentions = self._format_user_mentions()
 
         if self.is_restored:
@@ -134,37 +151,99 @@ class SlackNotifier:
             message = f"{user_mentions}*Site Monitoring Alert*\nSite is down: {self.link} ❌"
             title = f"Site Down Alert - {self.link}"
 
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": message
-                }
-            }
-        ]
+        blocks = [_section(message)]
 
         if self.stacktrace:
-            blocks.append({
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": f"```{self.stacktrace}```"
-                }
-            })
+            blocks.append(_code_section(self.stacktrace))
 
         payload = {
             "blocks": blocks,
             "text": title
         }
 
-        await self.send_slack_message(payload)
+        return payload
 
-    async def send_notification(self):
+    def build_payload(self) -> dict:
         if self.is_table:
-            await self.send_table_update_notification()
-        else:
-            await self.send_site_down_notification()
+            return self.build_table_update_payload()
+        return self.build_site_down_payload()
+
+    async def send_notification(self):
+        """Send this notification on its own, bypassing the :class:`SlackBatcher`."""
+        await self.send_slack_message(self.build_payload())
+
+
+class SlackBatcher:
+    """
+    Coalesces the notifications queued within a short window into a single Slack
+    message, so a burst of alerts costs one webhook post instead of one each.
+
+    Attributes
+    ----------
+    MAX_BATCH: int
+        The maximum number of notifications combined into one message.
+    WINDOW: float
+        How long, in seconds, to wait for more notifications after the first one.
+    """
+
+    MAX_BATCH = 20
+    WINDOW = 0.5
 
-        if self.auto_close:
-            await self.close_session()
+    _queue: Optional[asyncio.Queue] = None
+    _flusher: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def enqueue(cls, notifier: SlackNotifier):
+        if cls._queue is None:
+            cls._queue = asyncio.Queue()
+        if cls._flusher is None or cls._flusher.done():
+            cls._flusher = asyncio.create_task(cls._flush_loop())
+        await cls._queue.put(notifier)
+
+    @classmethod
+    async def _flush_loop(cls):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await cls._queue.get()]
+            deadline = loop.time() + cls.WINDOW
+            while len(items) < cls.MAX_BATCH:
+                try:
+                    items.append(await asyncio.wait_for(cls._queue.get(), deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await cls.send_combined(items)
+            except Exception as e:
+                log.error(f"Failed to send batched Slack message: {e}")
+            finally:
+                for _ in items:
+                    cls._queue.task_done()
+
+    @staticmethod
+    async def send_combined(items: List[SlackNotifier]):
+        """
+        Send the notifications as one Slack message by concatenating their blocks. If
+        Slack rejects the combined message, send them one by one, so a single bad
+        payload doesn't lose the whole batch.
+        """
+        payloads = [item.build_payload() for item in items]
+        payload = {
+            "blocks": [block for p in payloads for block in p["blocks"]],
+            "text": "\n".join(p["text"] for p in payloads)
+        }
+        status = await items[0].send_slack_message(payload)
+        if len(items) > 1 and status is not None and 400 <= status < 500 and status != 429:
+            log.warning(f"Slack rejected a batch of {len(items)} notifications, sending them one by one")
+            for item, single in zip(items, payloads):
+                await item.send_slack_message(single)
+
+    @classmethod
+    async def close(cls):
+        """Send the pending notifications and stop the background flusher."""
+        if cls._queue is not None and cls._flusher is not None and not cls._flusher.done():
+            await cls._queue.join()
+        if cls._flusher is not None:
+            cls._flusher.cancel()
+        cls._queue = None
+        cls._flusher = None
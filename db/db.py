@@ -1,45 +1,38 @@
-import os
-from datetime import datetime
-from typing import List, Dict, Optional
+from datetime import datetime, timezone
+from typing import Iterable, List, Dict, Optional, Tuple
 
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection
+from pymongo import ASCENDING, AsyncMongoClient, UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.database import AsyncDatabase
 
 from utils.config import Settings
 
 
 class MongoDB:
-    _instance = None
-    client: Optional[AsyncIOMotorClient] = None
-    db: Optional[AsyncIOMotorDatabase] = None
-    urls: Optional[AsyncIOMotorCollection] = None
-    states: Optional[AsyncIOMotorCollection] = None
-
-    URLS_COLLECTION = os.getenv("MONGODB_MONITOR_URLS_COLLECTION")
-    TIMESTAMPS_COLLECTION = os.getenv("MONGODB_TIMESTAMPS_COLLECTION")
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(MongoDB, cls).__new__(cls)
-        return cls._instance
+    client: Optional[AsyncMongoClient] = None
+    db: Optional[AsyncDatabase] = None
+    urls: Optional[AsyncCollection] = None
+    states: Optional[AsyncCollection] = None
 
     @classmethod
     async def connect(cls, settings: Settings):
         if not cls.client:
-            cls.client = AsyncIOMotorClient(settings.MONGODB_URI)
+            cls.client = AsyncMongoClient(settings.MONGODB_URI)
             cls.db = cls.client[settings.MONGODB_DB]
-            cls.urls = cls.db[cls.URLS_COLLECTION]
-            cls.states = cls.db[cls.TIMESTAMPS_COLLECTION]
+            cls.urls = cls.db[settings.MONGODB_MONITOR_URLS_COLLECTION]
+            cls.states = cls.db[settings.MONGODB_TIMESTAMPS_COLLECTION]
             await cls.create_indexes()
 
     @classmethod
     async def create_indexes(cls):
         await cls.urls.create_index("url", unique=True)
         await cls.states.create_index("monitor_type", unique=True)
+        await cls.states.create_index([("last_check", ASCENDING)])
 
     @classmethod
     async def close(cls):
         if cls.client:
-            cls.client.close()
+            await cls.client.close()
             cls.client = None
             cls.db = None
             cls.urls = None
@@ -47,22 +40,44 @@ class MongoDB:
 
     @classmethod
     async def get_urls(cls) -> List[Dict]:
-        return await cls.urls.find().to_list(length=None)
+        return await cls.urls.find({}, projection={"url": 1, "name": 1, "_id": 0}).to_list(length=None)
 
     @classmethod
     async def add_url(cls, url: str, name: str):
+        now = datetime.now(tz=timezone.utc)
         await cls.urls.update_one(
             {"url": url},
             {
                 "$set": {
                     "name": name,
-                    "updated_at": datetime.now()
+                    "updated_at": now
                 },
-                "$setOnInsert": {"created_at": datetime.now()}
+                "$setOnInsert": {"created_at": now}
             },
             upsert=True
         )
 
+    @classmethod
+    async def add_urls(cls, items: Iterable[Tuple[str, str]]):
+        """Upsert many ``(url, name)`` pairs in a single bulk write."""
+        now = datetime.now(tz=timezone.utc)
+        operations = [
+            UpdateOne(
+                {"url": url},
+                {
+                    "$set": {
+                        "name": name,
+                        "updated_at": now
+                    },
+                    "$setOnInsert": {"created_at": now}
+                },
+                upsert=True
+            )
+            for url, name in items
+        ]
+        if operations:
+            await cls.urls.bulk_write(operations, ordered=False)
+
     @classmethod
     async def remove_url(cls, url: str):
         await cls.urls.delete_one({"url": url})
@@ -70,7 +85,11 @@ class MongoDB:
     @classmethod
     async def get_last_check_time(cls, monitor_type: str) -> datetime:
         state = await cls.states.find_one({"monitor_type": monitor_type})
-        return datetime.fromisoformat(state["last_check"]) if state else datetime.now()
+        if not state:
+            return datetime.now()
+        last_check = state["last_check"]
+        # Documents written before last_check was stored as a BSON date hold an ISO string
+        return datetime.fromisoformat(last_check) if isinstance(last_check, str) else last_check
 
     @classmethod
     async def update_last_check_time(cls, monitor_type: str, check_time: datetime):
@@ -78,8 +97,8 @@ class MongoDB:
             {"monitor_type": monitor_type},
             {
                 "$set": {
-                    "last_check": check_time.isoformat(),
-                    "updated_at": datetime.now()
+                    "last_check": check_time,
+                    "updated_at": datetime.now(tz=timezone.utc)
                 }
             },
             upsert=True
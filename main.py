@@ -5,29 +5,45 @@ from contextlib import asynccontextmanager
 from a2wsgi import ASGIMiddleware
 from fastapi import FastAPI
 
-from components.mysql_table_monitor import monitor_sql_table, DatabaseMonitor
+from components.mysql_binlog_monitor import binlog_monitor, binlog_triggered_monitor
+from components.mysql_table_monitor import monitor_sql_tables, close_engines
 from components.site_uptime_monitor import monitor_urls
-from utils.config import Settings
+from components.slack_notifier import SlackBatcher
+from utils.config import Settings, get_settings
+from utils.http import close_session
+from utils.log import setup_logging
+from utils.loop import install_eager_task_factory
 
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
-    settings = Settings()
+    settings = get_settings()
+    install_eager_task_factory()
     monitor_task = asyncio.create_task(monitor_tasks(settings))
     yield
     monitor_task.cancel()
-    await DatabaseMonitor.close()
+    # Let the monitors' own cleanup finish before the resources they use are closed
+    await asyncio.gather(monitor_task, return_exceptions=True)
+    await close_engines()
+    await SlackBatcher.close()
+    await close_session()
 
 
 app = FastAPI(lifespan=lifespan)
 
 
 async def monitor_tasks(settings: Settings):
+    if settings.MYSQL_BINLOG_WAKEUP:
+        table_monitor = binlog_triggered_monitor
+    elif settings.MYSQL_BINLOG_ENABLED:
+        table_monitor = binlog_monitor
+    else:
+        table_monitor = monitor_sql_tables
     try:
         await asyncio.gather(
-            monitor_sql_table(settings),
+            table_monitor(settings),
             monitor_urls()
         )
     except Exception as e:
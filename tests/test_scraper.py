@@ -0,0 +1,42 @@
+import unittest
+
+from utils.scraper import extract_stacktrace
+
+# Pages and the stacktraces the BeautifulSoup implementation extracted from them
+CASES = [
+    ('nested div',
+     '<div class="error">Outer <div>inner</div> tail</div><div>after</div>',
+     'Outer inner tail'),
+    ('unclosed element',
+     '<p>Oops</p><pre class="stacktrace">Traceback (most recent call last):\n  File "app.py"',
+     'Traceback (most recent call last):\n  File "app.py"'),
+    ('entities',
+     '<blockquote>Error: a &lt; b &amp;&amp; c &quot;d&quot;</blockquote>',
+     'Error: a < b && c "d"'),
+    ('blockquote lines',
+     '<blockquote>\n  cfthrow at line 12\n\n  <b>in</b> index.cfm  \n</blockquote>',
+     'cfthrow at line 12\nin index.cfm'),
+    ('several classes',
+     "<div class='panel exception'>  Boom  </div>",
+     'Boom'),
+    ('data-class attribute',
+     '<div data-class="error">not a container</div>',
+     None),
+    ('commented out container',
+     '<!-- <div class="error">old</div> --><p>class error</p>',
+     None),
+    ('no markers',
+     '<html><body>Service unavailable</body></html>',
+     None),
+]
+
+
+class ExtractStacktraceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_matches_beautifulsoup(self):
+        for name, page, expected in CASES:
+            with self.subTest(name):
+                self.assertEqual(await extract_stacktrace(page), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
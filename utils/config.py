@@ -1,32 +1,66 @@
-from dotenv import load_dotenv
-from pydantic import Field
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
-load_dotenv()
+# The .env file at the project root, wherever the process is started from
+ENV_FILE = Path(__file__).resolve().parent.parent / ".env"
+
+
+class TableSettings(BaseModel):
+    """One of ``MYSQL_TABLES``: the table settings that differ from the primary table's."""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+    MYSQL_TABLE_NAME: str
+    MYSQL_TABLE_COLUMNS: str
+    MYSQL_DETAILS_QUERY: str
+    MYSQL_MAX_QUERY: Optional[str] = None
+    MYSQL_MAX_ROWS: Optional[int] = Field(default=None, gt=0)
+    MYSQL_WATERMARK_COLUMN: Optional[str] = None
 
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         case_sensitive=True,
-        env_file="../.env",
+        env_file=ENV_FILE,
         env_file_encoding="utf-8",
         extra="ignore",
+        frozen=True,
     )
     MONGODB_URI: str
     MONGODB_DB: str
+    MONGODB_MONITOR_URLS_COLLECTION: Optional[str] = None
+    MONGODB_TIMESTAMPS_COLLECTION: Optional[str] = None
     MONITOR_INTERVAL: int = Field(default=300, gt=0)
     DOWN_MONITOR_INTERVAL: int = Field(default=120, gt=0)
     REQUEST_RETRIES: int = Field(default=10, gt=0)
     REQUEST_TIMEOUT: int = Field(default=90, gt=0)
+    MAX_CONCURRENT_REQUESTS: int = Field(default=50, gt=0)
     SLACK_WEBHOOK_URL: str
 
     MYSQL_HOST: str
     MYSQL_TABLE_NAME: str
     MYSQL_TABLE_COLUMNS: str
-    MYSQL_SELECT_QUERY: str
+    # Deprecated: the row count is now taken from MYSQL_DETAILS_QUERY
+    MYSQL_SELECT_QUERY: Optional[str] = None
     MYSQL_DETAILS_QUERY: str
+    MYSQL_MAX_QUERY: Optional[str] = None
+    MYSQL_MAX_ROWS: int = Field(default=500, gt=0)
+    MYSQL_WATERMARK_COLUMN: Optional[str] = None
+    # More tables to poll, each with its own queries
+    MYSQL_TABLES: List[TableSettings] = []
+    MYSQL_BINLOG_ENABLED: bool = False
+    MYSQL_BINLOG_WAKEUP: bool = False
+    MYSQL_BINLOG_SERVER_ID: int = Field(default=100, gt=0)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the settings, reading and validating the environment only once."""
+    return Settings()
 
 
 if __name__ == "__main__":
-    settings = Settings()
+    settings = get_settings()
     print(settings.model_dump_json(indent=2))
@@ -0,0 +1,52 @@
+# utils/http.py
+
+from typing import Optional
+
+import aiohttp
+
+_connector: Optional[aiohttp.TCPConnector] = None
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_connector() -> aiohttp.TCPConnector:
+    """
+    Return the process-wide connection pool, creating it on first use. Reusing it keeps
+    connections alive and DNS results cached between polls.
+    """
+    global _connector
+    if _connector is None or _connector.closed:
+        _connector = aiohttp.TCPConnector(
+            limit=200,
+            limit_per_host=8,
+            use_dns_cache=True,
+            ttl_dns_cache=300,
+            resolver=aiohttp.AsyncResolver(),
+            force_close=False,
+            enable_cleanup_closed=True,
+            keepalive_timeout=75,
+        )
+    return _connector
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """
+    Return the process-wide HTTP session, creating it on first use. The session does not
+    own the connector, so closing it never tears down the shared connection pool.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=get_connector(),
+            connector_owner=False,
+        )
+    return _session
+
+
+async def close_session():
+    global _connector, _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    if _connector is not None and not _connector.closed:
+        await _connector.close()
+    _session = None
+    _connector = None
@@ -0,0 +1,38 @@
+# utils/log.py
+
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+LOG_FILE = "uptime.log"
+LOG_FORMAT = "[%(levelname)s] [%(asctime)s] %(message)s"
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: int = logging.INFO):
+    """
+    Send log records to ``uptime.log`` and stderr from a background thread. Loggers only
+    put records on a queue, so writing them never blocks the event loop. Safe to call
+    more than once; only the first call configures logging.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(LOG_FILE, encoding="utf-8"), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(records))
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush the records still queued when the process exits
+    atexit.register(_listener.stop)
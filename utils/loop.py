@@ -0,0 +1,43 @@
+# utils/loop.py
+
+import asyncio
+import signal
+
+try:
+    import uvloop
+except ImportError:  # uvloop is not available on Windows
+    uvloop = None
+
+
+def install_event_loop_policy():
+    """Run the event loops created by ``asyncio.run`` on uvloop when it is installed."""
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def install_eager_task_factory():
+    """
+    Start new tasks on the running loop eagerly, so coroutines that finish without
+    suspending skip a round trip through the event loop. Needs Python 3.12.
+    """
+    asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
+
+async def wait_for_any(timeout: float, *events: asyncio.Event):
+    """Wait until one of the events is set or ``timeout`` seconds pass, whichever is first."""
+    waiters = [asyncio.ensure_future(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+
+def install_stop_signal_handlers(stop: asyncio.Event):
+    """Set ``stop`` on SIGINT or SIGTERM instead of interrupting whatever is running."""
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Not supported by the Windows event loops
+            pass
@@ -1,23 +1,86 @@
 # utils/scraper.py
 
+import html
 import logging
+import re
 from typing import Optional
 
-from bs4 import BeautifulSoup
-
-logging.basicConfig(
-    filename="uptime.log",
-    encoding="utf-8",
-    level=logging.INFO,
-    format="[%(levelname)s] [%(asctime)s] %(message)s",
-)
 log = logging.getLogger(__name__)
 
+_BLOCKQUOTE_RE = re.compile(r'<blockquote\b[^>]*>', re.IGNORECASE)
+_CONTAINER_RE = re.compile(r'<(div|pre)\b([^>]*)>', re.IGNORECASE)
+_NESTED_TAG_RE = {
+    tag: re.compile(rf'<(/?){tag}\b[^>]*>', re.IGNORECASE) for tag in ('blockquote', 'div', 'pre')
+}
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_CLASS_RE = re.compile(r"""(?:^|\s)class\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]*>')
+ERROR_CLASSES = frozenset(('error', 'stacktrace', 'exception'))
+
+
+def _may_contain_stacktrace(response_text: str) -> bool:
+    """
+    Cheap substring checks on the raw page, without a lowercased copy: a stacktrace
+    needs a blockquote, or a class attribute naming one of ``ERROR_CLASSES``.
+    """
+    if '<blockquote' in response_text or '<BLOCKQUOTE' in response_text:
+        return True
+    if 'class' not in response_text and 'CLASS' not in response_text:
+        return False
+    return any(name in response_text for name in ERROR_CLASSES)
+
+
+def _text(fragment: str) -> str:
+    """Return the text of an HTML fragment, without tags and with entities decoded."""
+    return html.unescape(_TAG_RE.sub('', fragment))
+
+
+def _element_body(response_text: str, tag: str, start: int) -> str:
+    """
+    Return the content of the ``tag`` element opened just before ``start``, up to its
+    matching closing tag, counting the same tags nested inside it. An element that is
+    never closed runs to the end of the page.
+    """
+    depth = 1
+    for match in _NESTED_TAG_RE[tag].finditer(response_text, start):
+        depth += -1 if match.group(1) else 1
+        if depth == 0:
+            return response_text[start:match.start()]
+    return response_text[start:]
+
+
+def _parse_stacktrace(response_text: str) -> Optional[str]:
+    if '<!--' in response_text:
+        response_text = _COMMENT_RE.sub('', response_text)
+
+    # Look for stacktrace in blockquote elements
+    for match in _BLOCKQUOTE_RE.finditer(response_text):
+        text = _text(_element_body(response_text, 'blockquote', match.end()))
+        if 'cfthrow' in text or 'error' in text.lower():
+            # Clean up the text (remove extra whitespace and normalize line endings)
+            stacktrace = '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+            return stacktrace
+
+    # Alternatively look for common error containers
+    for match in _CONTAINER_RE.finditer(response_text):
+        class_attr = _CLASS_RE.search(match.group(2))
+        if class_attr is None:
+            continue
+        classes = next(value for value in class_attr.groups() if value is not None).split()
+        if ERROR_CLASSES.isdisjoint(classes):
+            continue
+        text = _text(_element_body(response_text, match.group(1).lower(), match.end())).strip()
+        if text:
+            return text
+
+    return None
+
 
 async def extract_stacktrace(response_text: str) -> Optional[str]:
     """
     Extract stacktrace information from HTML response if available.
     Looks for stacktrace in blockquote elements or specific error sections.
+    The page is scanned with precompiled regular expressions rather than parsed.
 
     Args:
         response_text: HTML content from the response
@@ -25,25 +88,12 @@ async def extract_stacktrace(response_text: str) -> Optional[str]:
     Returns:
         Extracted stacktrace or None if not found
     """
-    try:
-        soup = BeautifulSoup(response_text, 'html.parser')
-
-        # Look for stacktrace in blockquote elements
-        blockquotes = soup.find_all('blockquote')
-        for blockquote in blockquotes:
-            if 'cfthrow' in blockquote.text or 'error' in blockquote.text.lower():
-                # Clean up the text (remove extra whitespace and normalize line endings)
-                stacktrace = '\n'.join(line.strip() for line in blockquote.text.splitlines() if line.strip())
-                return stacktrace
-
-        # Alternatively look for common error containers
-        error_containers = soup.find_all(['div', 'pre'], class_=['error', 'stacktrace', 'exception'])
-        for container in error_containers:
-            if container.text.strip():
-                return container.text.strip()
-
+    if not _may_contain_stacktrace(response_text):
         return None
 
+    try:
+        return _parse_stacktrace(response_text)
+
     except Exception as e:
         log.error(f"Error parsing HTML for stacktrace: {e}")
         return None